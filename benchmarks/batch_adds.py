@@ -0,0 +1,42 @@
+"""Benchmark sequential grocery adds with and without write coalescing."""
+# benchmarks/batch_adds.py
+
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+from pathlib import Path
+from groceries import database, grocery
+
+def _run(db_path: Path, count: int, mode: str) -> float:
+    database.init_database(db_path)
+    if mode == "group":
+        gc = grocery.GroceryController(db_path, commit_every=1000)
+    else:
+        gc = grocery.GroceryController(db_path)
+    batch = gc.batch() if mode == "batch" else contextlib.nullcontext()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), batch:
+        for i in range(count):
+            gc.add([f"item {i}"], grocery.GroceryType.pantry)
+        gc.flush()
+    return time.perf_counter() - start
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=10_000)
+    parser.add_argument(
+        "--modes", nargs="+", default=["direct", "group", "batch"],
+        choices=["direct", "group", "batch"],
+    )
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "groceries.json"
+        for mode in args.modes:
+            elapsed = _run(db_path, args.count, mode)
+            print(f"{mode:>6}: {args.count} adds in {elapsed:.2f}s"
+                  f" ({args.count / elapsed:,.0f} adds/s)")
+
+if __name__ == "__main__":
+    main()
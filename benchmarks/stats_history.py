@@ -0,0 +1,54 @@
+"""Benchmark groceries stats over a large synthetic purchase history."""
+# benchmarks/stats_history.py
+
+import argparse
+import random
+import struct
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+from groceries import database, grocery, history
+
+def _fill_history(db_path: Path, purchases: int, items: int) -> None:
+    """Write rows straight to the history file in the format it uses."""
+    hc = history.HistoryController(db_path)
+    categories = list(grocery.GroceryType)
+    first_day = date.today().toordinal() - 10 * 365
+    for item in range(items):
+        hc.add_purchase(
+            {"Name": f"item {item}", "Category": categories[item % len(categories)].value},
+            1.0, "each", 1.0, date.fromordinal(first_day),
+        )
+    row = struct.Struct("<qqdd")
+    with db_path.with_name(db_path.name + ".history").open("ab") as rows:
+        for purchase in range(purchases):
+            rows.write(row.pack(
+                first_day + purchase * 10 * 365 // purchases,
+                random.randrange(items),
+                random.randint(1, 4),
+                round(random.uniform(0.5, 20), 2),
+            ))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--purchases", type=int, default=1_000_000)
+    parser.add_argument("--items", type=int, default=500)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "groceries.json"
+        database.init_database(db_path)
+        _fill_history(db_path, args.purchases, args.items)
+        grocery_bank = [
+            {"Name": f"item {item}", "Category": "pantry"} for item in range(50)
+        ]
+        hc = history.HistoryController(db_path)
+        for days in (365, 10 * 365):
+            start = time.perf_counter()
+            hc.get_stats(grocery_bank, days)
+            elapsed = time.perf_counter() - start
+            print(f"stats over {days} days of {args.purchases} purchases:"
+                  f" {elapsed:.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,9 @@ __version__ = "0.1.0"
     JSON_ERROR,
     ID_ERROR,
     EXISTS_ERROR,
-) = range(8)
+    FORMAT_ERROR,
+    OUTPUT_ERROR,
+) = range(10)
 
 ERRORS = {
     DIR_ERROR: "config directory error",
@@ -23,4 +25,6 @@ ERRORS = {
     JSON_ERROR: "json error",
     ID_ERROR: "grocery id error",
     EXISTS_ERROR: "already exists error",
+    FORMAT_ERROR: "record format error",
+    OUTPUT_ERROR: "output file error",
 }
\ No newline at end of file
@@ -1,11 +1,14 @@
 """This module provides the Groceries CLI."""
 # groceries/cli.py
 
+import os
+from datetime import datetime
 from pathlib import Path
 from typing import List, Optional
 import typer
 from groceries import (
-    ERRORS, __app_name__, __version__, config, database, grocery, recipe
+    ERRORS, OUTPUT_ERROR, __app_name__, __version__, config, database, grocery,
+    history, integrity, recipe, transfer
 )
 
 app = typer.Typer()
@@ -13,6 +16,8 @@ grocery_items_app = typer.Typer()
 app.add_typer(grocery_items_app, name="items")
 recipes_app = typer.Typer()
 app.add_typer(recipes_app, name="recipes")
+db_app = typer.Typer()
+app.add_typer(db_app, name="db")
 
 #
 # Global commands such as version and init
@@ -85,12 +90,16 @@ def validate_config() -> Path:
 #
 #   Grocery items app functions
 #
-def get_grocery_controller() -> grocery.GroceryController:
-    db_path = validate_config()
+def get_grocery_controller(db_path: Optional[Path] = None) -> grocery.GroceryController:
+    db_path = db_path or validate_config()
     if not db_path:
         raise typer.Exit(1)
     
-    return grocery.GroceryController(db_path)
+    try:
+        layout = grocery.store_layout(config.get_store_layout())
+    except ValueError:
+        layout = grocery.store_layout()
+    return grocery.GroceryController(db_path, layout=layout)
 
     
 @grocery_items_app.command(name="remove")
@@ -183,10 +192,31 @@ def grocery_items_add(
         )
 
 @grocery_items_app.command(name="list")
-def grocery_items_list_all() -> None:
+def grocery_items_list_all(
+    by_aisle: bool = typer.Option(
+        False,
+        "--by-aisle",
+        "-a",
+        help="Order groceries by store aisle, then by name.",
+    ),
+) -> None:
     """List all groceries in bank."""
     gc = get_grocery_controller()
-    grocery_bank = gc.get_grocery_bank()
+    if by_aisle:
+        grocery_bank, error = gc.get_aisle_order()
+        if error and not grocery_bank:
+            typer.secho(
+                f'Listing groceries by aisle failed with "{ERRORS[error]}"',
+                fg=typer.colors.RED,
+            )
+            raise typer.Exit(1)
+        if error:
+            typer.secho(
+                f'Saving the aisle index failed with "{ERRORS[error]}"',
+                fg=typer.colors.YELLOW,
+            )
+    else:
+        grocery_bank = list(enumerate(gc.get_grocery_bank(), 1))
     if len(grocery_bank) == 0:
         typer.secho(
             "There are no groceries in the bank yet",
@@ -202,8 +232,8 @@ def grocery_items_list_all() -> None:
     headers = "".join(columns)
     typer.secho(headers, fg=typer.colors.MAGENTA, bold=True)
     typer.secho("-" * len(headers), fg=typer.colors.MAGENTA)
-    for id, grocery in enumerate(grocery_bank, 1):
-        name, category = grocery.values()
+    for id, grocery in grocery_bank:
+        name, category = grocery["Name"], grocery["Category"]
         typer.secho(
             f"{id}{(len(columns[0]) - len(str(id))) * ' '}"
             f"| {category}{(len(columns[1]) - len(str(category)) - 2) * ' '}"
@@ -212,6 +242,84 @@ def grocery_items_list_all() -> None:
         )
     typer.secho("-" * len(headers) + "\n", fg=typer.colors.MAGENTA)
 
+@grocery_items_app.command(name="buy")
+def grocery_items_buy(
+    grocery_id: int = typer.Argument(...),
+    price: float = typer.Option(
+        ...,
+        "--price",
+        "-p",
+        min=0,
+        help="Price paid per unit.",
+    ),
+    quantity: float = typer.Option(
+        1.0,
+        "--quantity",
+        "-q",
+        min=0,
+        help="Number of units bought.",
+    ),
+    unit: str = typer.Option(
+        "each",
+        "--unit",
+        "-u",
+        help="Unit the price is for, such as lb or gal.",
+    ),
+    bought_on: Optional[datetime] = typer.Option(
+        None,
+        "--date",
+        "-d",
+        formats=["%Y-%m-%d"],
+        help="Day of the purchase. Defaults to today.",
+    ),
+) -> None:
+    """Record a purchase of the grocery item with GROCERY_ID."""
+    db_path = validate_config()
+    if not db_path:
+        raise typer.Exit(1)
+    gc = get_grocery_controller(db_path)
+    grocery_bank = gc.get_grocery_bank()
+    try:
+        grocery = grocery_bank[grocery_id - 1]
+    except IndexError:
+        typer.secho("Invalid GROCERY_ID", fg=typer.colors.RED)
+        raise typer.Exit(1)
+    hc = history.HistoryController(db_path)
+    purchase, error = hc.add_purchase(
+        grocery, quantity, unit, price, bought_on.date() if bought_on else None
+    )
+    if error:
+        typer.secho(
+            f'Recording purchase failed with "{ERRORS[error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    typer.secho(
+        f"""bought {purchase.quantity:g} {purchase.unit} of '{purchase.name}'"""
+        f""" at {purchase.price:.2f} on {purchase.day}""",
+        fg=typer.colors.GREEN,
+    )
+
+@grocery_items_app.command(name="layout")
+def grocery_items_layout(
+    aisles: Optional[List[grocery.GroceryType]] = typer.Argument(None),
+) -> None:
+    """Show the store layout, or set it to the given AISLES in order."""
+    if aisles:
+        error = config.set_store_layout([aisle.value for aisle in aisles])
+        if error:
+            typer.secho(
+                f'Saving store layout failed with "{ERRORS[error]}"',
+                fg=typer.colors.RED,
+            )
+            raise typer.Exit(1)
+    try:
+        layout = grocery.store_layout(config.get_store_layout())
+    except ValueError:
+        typer.secho("Store layout is invalid, using the default", fg=typer.colors.RED)
+        layout = grocery.store_layout()
+    typer.secho(f"store layout: {' -> '.join(layout)}", fg=typer.colors.GREEN)
+
 #
 # Recipes app functions
 #
@@ -339,4 +447,204 @@ def recipes_remove_all(
                         fg=typer.colors.GREEN)
     
     else:
-        typer.echo("Operation canceled")
\ No newline at end of file
+        typer.echo("Operation canceled")
+
+#
+# Export and import functions
+#
+def _bank_type(recipes: bool) -> str:
+    return transfer.RECIPE_BANK if recipes else transfer.GROCERY_BANK
+
+@app.command(name="export")
+def export_bank(
+    path: Path = typer.Argument(..., dir_okay=False, writable=True),
+    file_format: transfer.FileFormat = typer.Option(
+        transfer.FileFormat.csv,
+        "--format",
+        "-f",
+        help="File format to write.",
+    ),
+    recipes: bool = typer.Option(
+        False,
+        "--recipes",
+        "-r",
+        help="Export recipes instead of grocery items.",
+    ),
+) -> None:
+    """Export grocery items or recipes to PATH."""
+    db_path = validate_config()
+    if not db_path:
+        raise typer.Exit(1)
+    # Write next to the target so a failed export leaves it untouched
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with tmp_path.open("w", newline="") as out:
+            error = transfer.export_bank(db_path, _bank_type(recipes), file_format, out)
+        if not error:
+            os.replace(tmp_path, path)
+    except OSError: # Catch file IO problems
+        error = OUTPUT_ERROR
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    if error:
+        typer.secho(
+            f'Exporting to {path} failed with "{ERRORS[error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    typer.secho(f"Exported to {path}", fg=typer.colors.GREEN)
+
+@app.command(name="import")
+def import_bank(
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, readable=True),
+    file_format: transfer.FileFormat = typer.Option(
+        transfer.FileFormat.csv,
+        "--format",
+        "-f",
+        help="File format to read (csv or jsonl).",
+    ),
+    recipes: bool = typer.Option(
+        False,
+        "--recipes",
+        "-r",
+        help="Import recipes instead of grocery items.",
+    ),
+) -> None:
+    """Import grocery items or recipes from PATH."""
+    db_path = validate_config()
+    if not db_path:
+        raise typer.Exit(1)
+    with path.open("r", newline="") as src:
+        count, error = transfer.import_bank(
+            db_path, _bank_type(recipes), file_format, src
+        )
+    if error:
+        typer.secho(
+            f'Importing from {path} failed with "{ERRORS[error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    typer.secho(f"Imported {count} new records from {path}",
+                fg=typer.colors.GREEN)
+
+#
+# Database maintenance functions
+#
+def _report_issues(report: integrity.CheckReport) -> None:
+    for offset, message in report.issues:
+        where = f"byte {offset}: " if offset is not None else ""
+        typer.secho(f"{where}{message}", fg=typer.colors.YELLOW)
+    typer.secho(
+        f"{report.counts[integrity.GROCERY_BANK]} grocery items and "
+        f"{report.counts[integrity.RECIPE_BANK]} recipes are readable",
+        fg=typer.colors.MAGENTA,
+    )
+
+@db_app.command(name="check")
+def db_check(
+    workers: Optional[int] = typer.Option(
+        None,
+        "--workers",
+        "-w",
+        help="Processes to validate with. Defaults to one per core.",
+    ),
+) -> None:
+    """Check the database for damaged, invalid or duplicate records."""
+    db_path = validate_config()
+    if not db_path:
+        raise typer.Exit(1)
+    report = integrity.check_database(db_path, workers)
+    if report.error:
+        typer.secho(
+            f'Checking database failed with "{ERRORS[report.error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    _report_issues(report)
+    if report.issues:
+        typer.secho(
+            f'Found {len(report.issues)} issues. Run "groceries db repair" to fix them',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    typer.secho("The database is healthy", fg=typer.colors.GREEN)
+
+@db_app.command(name="repair")
+def db_repair(
+    workers: Optional[int] = typer.Option(
+        None,
+        "--workers",
+        "-w",
+        help="Processes to validate with. Defaults to one per core.",
+    ),
+) -> None:
+    """Rewrite the database keeping every readable, valid record."""
+    db_path = validate_config()
+    if not db_path:
+        raise typer.Exit(1)
+    report = integrity.repair_database(db_path, workers)
+    if report.error:
+        typer.secho(
+            f'Repairing database failed with "{ERRORS[report.error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    _report_issues(report)
+    if report.issues:
+        typer.secho(
+            f"Repaired {len(report.issues)} issues. The old database was"
+            f" kept as {db_path.name}.bak",
+            fg=typer.colors.GREEN,
+        )
+    else:
+        typer.secho("The database is healthy", fg=typer.colors.GREEN)
+
+#
+# Spending statistics functions
+#
+@app.command(name="stats")
+def stats(
+    days: int = typer.Option(
+        365,
+        "--days",
+        "-d",
+        min=1,
+        help="Number of days of history to summarise.",
+    ),
+) -> None:
+    """Show spending by category, price trends and the grocery bank's cost."""
+    db_path = validate_config()
+    if not db_path:
+        raise typer.Exit(1)
+    gc = get_grocery_controller(db_path)
+    hc = history.HistoryController(db_path)
+    grocery_bank = gc.get_grocery_bank()
+    category_spend, price_trends, projected_cost, priced, error = hc.get_stats(
+        grocery_bank, days
+    )
+    if error:
+        typer.secho(
+            f'Reading purchase history failed with "{ERRORS[error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    typer.secho(f"\nspend by category, last {days} days:\n",
+                fg=typer.colors.MAGENTA, bold=True)
+    for category, spend in category_spend.items():
+        typer.secho(f"{category:<10}{spend:>10.2f}", fg=typer.colors.MAGENTA)
+    typer.secho(f"{'total':<10}{sum(category_spend.values()):>10.2f}",
+                fg=typer.colors.MAGENTA, bold=True)
+    if price_trends:
+        typer.secho("\nprice trends:\n", fg=typer.colors.MAGENTA, bold=True)
+    for name, unit, first_price, last_price, purchases in price_trends:
+        change = (last_price / first_price - 1) * 100 if first_price else 0.0
+        typer.secho(
+            f"{name} ({unit}): {first_price:.2f} -> {last_price:.2f}"
+            f" ({change:+.1f}% over {purchases} purchases)",
+            fg=typer.colors.MAGENTA,
+        )
+    typer.secho(
+        f"\nprojected cost of the grocery bank: {projected_cost:.2f}"
+        f" ({priced} of {len(grocery_bank)} items priced)\n",
+        fg=typer.colors.GREEN,
+    )
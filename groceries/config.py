@@ -3,6 +3,7 @@
 
 import configparser
 from pathlib import Path
+from typing import List
 import typer
 from groceries import (
     DB_WRITE_ERROR, DIR_ERROR, FILE_ERROR, SUCCESS, __app_name__
@@ -40,4 +41,23 @@ def _create_database(db_path: str) -> int:
             config_parser.write(file)
     except OSError:
         return DB_WRITE_ERROR
-    return SUCCESS
\ No newline at end of file
+    return SUCCESS
+
+def get_store_layout() -> List[str]:
+    """Return the configured aisle order, or [] if none has been set."""
+    config_parser = configparser.ConfigParser()
+    config_parser.read(CONFIG_FILE_PATH)
+    aisles = config_parser.get("Store Layout", "aisles", fallback="")
+    return [aisle.strip() for aisle in aisles.split(",") if aisle.strip()]
+
+def set_store_layout(aisles: List[str]) -> int:
+    """Save the aisle order used by "items list --by-aisle"."""
+    config_parser = configparser.ConfigParser()
+    config_parser.read(CONFIG_FILE_PATH)
+    config_parser["Store Layout"] = {"aisles": ", ".join(aisles)}
+    try:
+        with CONFIG_FILE_PATH.open("w") as file:
+            config_parser.write(file)
+    except OSError:
+        return FILE_ERROR
+    return SUCCESS
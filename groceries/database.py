@@ -1,16 +1,27 @@
 """This module provides the Groceries database functionality."""
 # groceries/database.py
 
+import asyncio
 import configparser
 import json
+import os
+import re
+import textwrap
+import time
+from concurrent.futures import Executor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, NamedTuple
+from typing import (
+    Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, TextIO, Tuple
+)
 from groceries import DB_READ_ERROR, DB_WRITE_ERROR, JSON_ERROR, SUCCESS
 
 DEFAULT_DB_FILE_PATH = Path.home().joinpath(
     "." + Path.home().stem + "_groceries.json"
 )
 
+_WHITESPACE = re.compile(r"\s*")
+
 def get_database_path(config_file: Path) -> Path:
     """Return the current path to the grocries database."""
     config_parser = configparser.ConfigParser()
@@ -25,36 +36,339 @@ def init_database(db_path: Path) -> int:
     except OSError:
         return DB_WRITE_ERROR
     
+class _JSONStream:
+    """Decode a JSON document from a file a chunk at a time."""
+    def __init__(self, db: TextIO, chunk_size: int = 64 * 1024) -> None:
+        self._db = db
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self.offset = 0 # Position of the buffer start within the file
+
+    def _fill(self) -> bool:
+        chunk = self._db.read(self._chunk_size)
+        if not chunk:
+            return False
+        self.offset += self._pos
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def error(self, msg: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(msg, self._buffer, self._pos)
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character, or "" at the end."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise self.error(f"Expecting one of {chars!r}")
+        self._pos += 1
+        return char
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise self.error("Expecting value") from None
+            # A value running to the end of the buffer may be cut short
+            if end < len(self._buffer) or not self._fill():
+                self._pos = end
+                return value
+
+    def array(self) -> Iterator[Any]:
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+def iter_banks(db: TextIO) -> Iterator[Tuple[str, Iterator[Dict[str, Any]]]]:
+    """Stream (bank type, items) pairs out of an open database file.
+
+    Each bank's items are decoded one at a time, so memory use does not grow
+    with the size of the file. A bank's iterator is only valid until the
+    next pair is requested.
+    """
+    stream = _JSONStream(db)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        bank_type = stream.value()
+        stream.expect(":")
+        items = stream.array()
+        yield bank_type, items
+        for _ in items: # Skip whatever the caller did not consume
+            pass
+        if stream.expect(",}") == "}":
+            return
+
 class DBResponse(NamedTuple):
     item_bank: List[Dict[str, Any]]
     error: int
 
+class DBBanks(NamedTuple):
+    banks: Dict[str, List[Dict[str, Any]]]
+    error: int
+
+def _dump_bank(
+    out: TextIO, bank_type: str, items: Iterable[Dict[str, Any]], first: bool
+) -> None:
+    """Write one bank the way json.dump(..., indent=4) lays it out."""
+    out.write(f"\n    {json.dumps(bank_type)}: [" if first
+              else f",\n    {json.dumps(bank_type)}: [")
+    separator = "\n"
+    for item in items:
+        out.write(separator)
+        out.write(textwrap.indent(json.dumps(item, indent=4), " " * 8))
+        separator = ",\n"
+    out.write("]" if separator == "\n" else "\n    ]")
+
+def write_database(
+    db_path: Path, banks: Dict[str, Iterable[Dict[str, Any]]],
+    backup_path: Optional[Path] = None,
+) -> int:
+    """Write a whole new database, streaming each bank into place.
+
+    The old file is moved to backup_path first when one is given.
+    """
+    tmp_path = db_path.with_name(db_path.name + ".tmp")
+    try:
+        with tmp_path.open("w") as out:
+            out.write("{")
+            for count, (bank_type, items) in enumerate(banks.items()):
+                _dump_bank(out, bank_type, items, first=count == 0)
+            out.write("\n}")
+        if backup_path is not None:
+            os.replace(db_path, backup_path)
+        os.replace(tmp_path, db_path)
+        return SUCCESS
+    except OSError: # Catch file IO problems
+        tmp_path.unlink(missing_ok=True)
+        return DB_WRITE_ERROR
+
+class DBBatch:
+    """Outcome of a batch; error is set once the batch has been flushed."""
+    def __init__(self) -> None:
+        self.error = SUCCESS
+
 class DatabaseHandler:
-    def __init__(self, db_path: Path) -> None:
+    """Read and write the item banks in the JSON database.
+
+    By default every write goes straight to disk. Inside batch(), or when
+    commit_every/commit_interval enable group commit, writes only update an
+    in-memory copy of the bank and are flushed to disk together:
+
+    - a batch flushes once when its outermost block exits; if the block
+      raises, its unflushed writes are discarded instead
+    - group commit flushes once commit_every writes have accumulated, or on
+      the first write made commit_interval seconds or more after the oldest
+      unflushed one; either threshold may be used on its own
+
+    There is no background timer, so the interval is only checked when a
+    write comes in. If a group commit flush fails, its banks stay pending
+    and the next flush retries them; a batch that fails to flush is rolled
+    back. Unflushed writes are lost if the process dies, so callers using
+    group commit must call flush() before exiting.
+    """
+    def __init__(
+        self,
+        db_path: Path,
+        commit_every: Optional[int] = None,
+        commit_interval: Optional[float] = None,
+    ) -> None:
         self._db_path = db_path
+        self._commit_every = commit_every
+        self._commit_interval = commit_interval
+        self._cache: Dict[str, List[Dict[str, Any]]] = {}
+        self._dirty: Set[str] = set()
+        self._unflushed = 0
+        self._oldest_unflushed: Optional[float] = None
+        self._batch_depth = 0
+
+    def _group_commit(self) -> bool:
+        return (
+            self._commit_every is not None and self._commit_every > 1
+        ) or self._commit_interval is not None
+
+    def _deferring(self) -> bool:
+        return self._batch_depth > 0 or self._group_commit()
 
     def read_items(self, bank_type: str) -> DBResponse:
+        read = self.read_banks([bank_type])
+        return DBResponse(read.banks.get(bank_type, []), read.error)
+
+    def read_banks(self, bank_types: Iterable[str]) -> DBBanks:
+        """Read several banks together with a single parse of the file."""
+        bank_types = list(bank_types)
+        if all(bank_type in self._cache for bank_type in bank_types):
+            return DBBanks(
+                {bank_type: self._cache[bank_type] for bank_type in bank_types}, SUCCESS
+            )
         print(f'DB path is {self._db_path}')
         try:
             with self._db_path.open("r") as db:
                 try:
                     json_data = json.load(db)
-                    return DBResponse(json_data[bank_type], SUCCESS)
                 except json.JSONDecodeError: # Catch wrong JSON format
-                    return DBResponse([], JSON_ERROR)
+                    return DBBanks({}, JSON_ERROR)
         except OSError: # Catch file IO problems
-            return DBResponse([], DB_READ_ERROR)
-        
+            return DBBanks({}, DB_READ_ERROR)
+        banks = {
+            bank_type: self._cache.get(bank_type, json_data.get(bank_type, []))
+            for bank_type in bank_types
+        }
+        if self._deferring():
+            self._cache.update(banks)
+        return DBBanks(banks, SUCCESS)
+
     def write_items(self, item_bank: List[Dict[str, Any]], bank_type: str) -> DBResponse:
+        return DBResponse(item_bank, self.write_banks({bank_type: item_bank}))
+
+    def write_banks(self, banks: Dict[str, List[Dict[str, Any]]]) -> int:
+        """Write several banks together as one change."""
+        if not self._deferring():
+            return self._write_banks(banks)
+        self._cache.update(banks)
+        self._dirty.update(banks)
+        if self._batch_depth > 0: # Batches only flush on exit
+            return SUCCESS
+        self._unflushed += 1
+        if self._oldest_unflushed is None:
+            self._oldest_unflushed = time.monotonic()
+        if (
+            self._commit_every is not None and self._unflushed >= self._commit_every
+        ) or (
+            self._commit_interval is not None
+            and time.monotonic() - self._oldest_unflushed >= self._commit_interval
+        ):
+            return self.flush()
+        return SUCCESS
+
+    def _write_banks(self, banks: Dict[str, List[Dict[str, Any]]]) -> int:
+        """Rewrite the file through a temporary copy.
+
+        Readers, including ones of other banks, only ever see the old or
+        the new file, never one being rewritten.
+        """
+        tmp_path = self._db_path.with_name(self._db_path.name + ".tmp")
         try:
-            with self._db_path.open("r+") as db:
+            with self._db_path.open("r") as db:
                 json_data = json.load(db)
-                json_data[bank_type] = item_bank
-                db.seek(0)
-                json.dump(json_data, db, indent=4)
-            return DBResponse(item_bank, SUCCESS)
+            json_data.update(banks)
+            with tmp_path.open("w") as out:
+                json.dump(json_data, out, indent=4)
+            os.replace(tmp_path, self._db_path)
+            return SUCCESS
+        except json.JSONDecodeError: # Catch wrong JSON format
+            return JSON_ERROR
+        except OSError: # Catch file IO problems
+            tmp_path.unlink(missing_ok=True)
+            return DB_WRITE_ERROR
+
+    def flush(self) -> int:
+        """Write every pending bank to disk in a single file write."""
+        error = SUCCESS
+        if self._dirty:
+            error = self._write_banks(
+                {bank_type: self._cache[bank_type] for bank_type in self._dirty}
+            )
+            if error and self._group_commit(): # Keep them pending for a retry
+                return error
+            if error: # Roll back to what is on disk
+                for bank_type in self._dirty:
+                    self._cache.pop(bank_type, None)
+        self._dirty.clear()
+        self._unflushed = 0
+        self._oldest_unflushed = None
+        if not self._deferring():
+            self._cache.clear()
+        return error
+
+    @contextmanager
+    def batch(self) -> Iterator[DBBatch]:
+        """Defer writes made inside the block and flush them once at the end."""
+        status = DBBatch()
+        if self._batch_depth == 0 and self._dirty: # Keep group commits out of the batch
+            status.error = self.flush()
+        self._batch_depth += 1
+        try:
+            yield status
+        except BaseException:
+            self._batch_depth -= 1
+            if self._batch_depth == 0: # Roll back to what is on disk
+                for bank_type in self._dirty:
+                    self._cache.pop(bank_type, None)
+                self._dirty.clear()
+                self._unflushed = 0
+                self._oldest_unflushed = None
+                if not self._group_commit():
+                    self._cache.clear()
+            raise
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            status.error = self.flush()
+
+    def iter_items(self, bank_type: str) -> Iterator[Dict[str, Any]]:
+        """Stream the items of a bank without loading the whole file.
+
+        Raises OSError or json.JSONDecodeError if the file cannot be read.
+        """
+        with self._db_path.open("r") as db:
+            for bank, items in iter_banks(db):
+                if bank == bank_type:
+                    yield from items
+
+    def write_stream(self, item_bank: Iterable[Dict[str, Any]], bank_type: str) -> int:
+        """Replace a bank with items streamed from item_bank.
+
+        The other banks are copied across a record at a time and the new
+        file replaces the old one only once it is complete, so item_bank may
+        itself be reading from this database. Exceptions raised by
+        item_bank leave the database untouched and are re-raised.
+        """
+        tmp_path = self._db_path.with_name(self._db_path.name + ".tmp")
+        try:
+            with self._db_path.open("r") as db, tmp_path.open("w") as out:
+                out.write("{")
+                banks = iter_banks(db)
+                written = False
+                for count, (bank, items) in enumerate(banks):
+                    if bank == bank_type:
+                        items, written = item_bank, True
+                    _dump_bank(out, bank, items, first=count == 0)
+                if not written:
+                    _dump_bank(out, bank_type, item_bank, first=out.tell() == 1)
+                out.write("\n}")
+            os.replace(tmp_path, self._db_path)
+            self._cache.pop(bank_type, None)
+            self._dirty.discard(bank_type)
+            return SUCCESS
+        except json.JSONDecodeError: # Catch wrong JSON format
+            tmp_path.unlink(missing_ok=True)
+            return JSON_ERROR
         except OSError: # Catch file IO problems
-            return DBResponse(item_bank, DB_WRITE_ERROR)
+            tmp_path.unlink(missing_ok=True)
+            return DB_WRITE_ERROR
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
 
     def read_groceries(self) -> DBResponse:
         return self.read_items("grocery bank")
@@ -62,8 +376,101 @@ class DatabaseHandler:
     def write_groceries(self, grocery_bank: List[Dict[str, Any]]) -> DBResponse:
         return self.write_items(grocery_bank, "grocery bank")
         
+    def read_groceries_and_aisle_index(self) -> DBBanks:
+        return self.read_banks(["grocery bank", "aisle index"])
+
+    def write_aisle_index(self, aisle_index: List[Dict[str, Any]]) -> DBResponse:
+        return self.write_items(aisle_index, "aisle index")
+
+    def write_groceries_and_aisle_index(
+        self, grocery_bank: List[Dict[str, Any]], aisle_index: List[Dict[str, Any]]
+    ) -> DBResponse:
+        error = self.write_banks(
+            {"grocery bank": grocery_bank, "aisle index": aisle_index}
+        )
+        return DBResponse(grocery_bank, error)
+
     def read_recipes(self) -> DBResponse:
         return self.read_items("recipe bank")
         
     def write_recipes(self, recipe_bank: List[Dict[str, Any]]) -> DBResponse:
-        return self.write_items(recipe_bank, "recipe bank")
\ No newline at end of file
+        return self.write_items(recipe_bank, "recipe bank")
+
+class AsyncDatabaseHandler:
+    """Run DatabaseHandler storage work on an executor.
+
+    Each bank is read from disk once and the resulting list is shared by
+    every reader. Writes update that shared list straight away and
+    concurrent writes are coalesced into a single flush. If a flush fails
+    the snapshot is dropped, so the next read reloads the bank from disk.
+    """
+    def __init__(self, db_path: Path, executor: Optional[Executor] = None) -> None:
+        self._db_handler = DatabaseHandler(db_path)
+        self._executor = executor
+        self._banks: Dict[str, List[Dict[str, Any]]] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._write_lock: Optional[asyncio.Lock] = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def read_items(self, bank_type: str) -> DBResponse:
+        """Return the shared in-memory snapshot of a bank."""
+        if bank_type in self._banks:
+            return DBResponse(self._banks[bank_type], SUCCESS)
+        loading = self._loading.get(bank_type)
+        if loading is None: # First reader loads the bank for everyone
+            loading = asyncio.ensure_future(
+                self._run(self._db_handler.read_items, bank_type)
+            )
+            self._loading[bank_type] = loading
+        read = await asyncio.shield(loading)
+        if self._loading.get(bank_type) is loading:
+            del self._loading[bank_type]
+            if not read.error: # Keep any write that landed while loading
+                self._banks.setdefault(bank_type, read.item_bank)
+        if bank_type not in self._banks:
+            return DBResponse([], read.error)
+        return DBResponse(self._banks[bank_type], SUCCESS)
+
+    async def write_items(self, item_bank: List[Dict[str, Any]], bank_type: str) -> DBResponse:
+        """Update the snapshot of a bank and wait for it to reach disk."""
+        bank = self._banks.setdefault(bank_type, item_bank)
+        if bank is not item_bank:
+            bank[:] = item_bank
+        pending = self._pending.get(bank_type)
+        if pending is None: # Later writers join this flush
+            pending = asyncio.ensure_future(self._flush(bank_type))
+            self._pending[bank_type] = pending
+        write = await asyncio.shield(pending)
+        return DBResponse(bank, write.error)
+
+    async def _flush(self, bank_type: str) -> DBResponse:
+        await asyncio.sleep(0) # Let writers scheduled alongside us join in
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock: # Both banks share one file
+            del self._pending[bank_type]
+            item_bank = list(self._banks[bank_type])
+            try:
+                write = await self._run(self._db_handler.write_items, item_bank, bank_type)
+            except BaseException:
+                self._banks.pop(bank_type, None)
+                raise
+            if write.error: # Stop serving writes that never reached disk
+                self._banks.pop(bank_type, None)
+            return write
+
+    async def read_groceries(self) -> DBResponse:
+        return await self.read_items("grocery bank")
+
+    async def write_groceries(self, grocery_bank: List[Dict[str, Any]]) -> DBResponse:
+        return await self.write_items(grocery_bank, "grocery bank")
+
+    async def read_recipes(self) -> DBResponse:
+        return await self.read_items("recipe bank")
+
+    async def write_recipes(self, recipe_bank: List[Dict[str, Any]]) -> DBResponse:
+        return await self.write_items(recipe_bank, "recipe bank")
@@ -1,11 +1,14 @@
 """This module provides the Groceries model-controller."""
 # groceries/grocery.py
 
+from concurrent.futures import Executor
 from pathlib import Path
 from enum import Enum
-from typing import Any, Dict, List, NamedTuple
-from groceries import DB_READ_ERROR, EXISTS_ERROR, ID_ERROR
-from groceries.database import DatabaseHandler
+from typing import (
+    Any, ContextManager, Dict, Iterable, List, NamedTuple, Optional, Tuple
+)
+from groceries import DB_READ_ERROR, EXISTS_ERROR, ID_ERROR, SUCCESS
+from groceries.database import AsyncDatabaseHandler, DatabaseHandler, DBBatch
 
 class GroceryType(str, Enum): 
     produce  = "produce"
@@ -19,9 +22,103 @@ class CurrentGrocery(NamedTuple):
     grocery: Dict[str, Any]
     error: int
 
+class AisleOrder(NamedTuple):
+    order: List[Tuple[int, Dict[str, Any]]]
+    error: int
+
+def store_layout(aisles: Iterable[str] = ()) -> List[str]:
+    """Return the aisle order for a layout, ending with any unlisted category."""
+    layout = []
+    for aisle in list(aisles) + [category.value for category in GroceryType]:
+        if GroceryType(aisle).value not in layout:
+            layout.append(GroceryType(aisle).value)
+    return layout
+
+def build_aisle_index(
+    grocery_bank: List[Dict[str, Any]], layout: List[str]
+) -> List[Dict[str, Any]]:
+    """Sort grocery IDs by aisle, then by name."""
+    aisles: Dict[str, List[int]] = {aisle: [] for aisle in layout}
+    for id, grocery in enumerate(grocery_bank, 1):
+        aisles.setdefault(grocery["Category"], []).append(id)
+    for ids in aisles.values():
+        ids.sort(key=lambda id: grocery_bank[id - 1]["Name"])
+    return [{"Category": aisle, "IDs": ids} for aisle, ids in aisles.items()]
+
+def _index_fits(
+    aisle_index: List[Dict[str, Any]], grocery_bank: List[Dict[str, Any]], layout: List[str]
+) -> bool:
+    try:
+        aisles = [aisle["Category"] for aisle in aisle_index]
+        size = sum(len(aisle["IDs"]) for aisle in aisle_index)
+    except (KeyError, TypeError):
+        return False
+    return aisles[:len(layout)] == layout and size == len(grocery_bank)
+
+def _index_insert(
+    aisle_index: List[Dict[str, Any]], grocery_bank: List[Dict[str, Any]], id: int
+) -> None:
+    grocery = grocery_bank[id - 1]
+    for aisle in aisle_index:
+        if aisle["Category"] == grocery["Category"]:
+            break
+    else:
+        aisle = {"Category": grocery["Category"], "IDs": []}
+        aisle_index.append(aisle)
+    ids = aisle["IDs"]
+    low, high = 0, len(ids)
+    while low < high: # Insert after any groceries with the same name
+        middle = (low + high) // 2
+        if grocery["Name"] < grocery_bank[ids[middle] - 1]["Name"]:
+            high = middle
+        else:
+            low = middle + 1
+    ids.insert(low, id)
+
+def _index_walk(
+    aisle_index: List[Dict[str, Any]], grocery_bank: List[Dict[str, Any]]
+) -> Optional[List[Tuple[int, Dict[str, Any]]]]:
+    """Return the groceries in index order, or None if the index is stale."""
+    order = []
+    seen = bytearray(len(grocery_bank) + 1)
+    for aisle in aisle_index:
+        previous = ""
+        for id in aisle["IDs"]:
+            if not 0 < id <= len(grocery_bank) or seen[id]:
+                return None
+            grocery = grocery_bank[id - 1]
+            if grocery["Category"] != aisle["Category"] or grocery["Name"] < previous:
+                return None
+            seen[id] = 1
+            previous = grocery["Name"]
+            order.append((id, grocery))
+    return order
+
 class GroceryController:
-    def __init__(self, db_path: Path) -> None:
-        self._db_handler = DatabaseHandler(db_path)
+    def __init__(
+        self,
+        db_path: Path,
+        commit_every: Optional[int] = None,
+        commit_interval: Optional[float] = None,
+        layout: Iterable[str] = (),
+    ) -> None:
+        self._db_handler = DatabaseHandler(db_path, commit_every, commit_interval)
+        self._layout = store_layout(layout)
+
+    def _fit_aisle_index(
+        self, aisle_index: List[Dict[str, Any]], grocery_bank: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        if not _index_fits(aisle_index, grocery_bank, self._layout):
+            return build_aisle_index(grocery_bank, self._layout)
+        return aisle_index
+
+    def batch(self) -> ContextManager[DBBatch]:
+        """Apply the changes made inside the block with a single write."""
+        return self._db_handler.batch()
+
+    def flush(self) -> CurrentGrocery:
+        """Write any changes still held back by group commit."""
+        return CurrentGrocery({}, self._db_handler.flush())
 
     def add(self, name: List[str], category: GroceryType) -> CurrentGrocery:
         """Add a new grocery item to the database."""
@@ -34,35 +131,119 @@ class GroceryController:
             "Category": category_text,
         }
 
-        read = self._db_handler.read_groceries()
+        read = self._db_handler.read_groceries_and_aisle_index()
         if read.error:
             return CurrentGrocery(grocery, read.error)
+        grocery_bank = read.banks["grocery bank"]
         
-        if grocery in read.item_bank:
+        if grocery in grocery_bank:
             return CurrentGrocery(grocery, EXISTS_ERROR)
         
-        read.item_bank.append(grocery)
-        write = self._db_handler.write_groceries(read.item_bank)
+        aisle_index = self._fit_aisle_index(read.banks["aisle index"], grocery_bank)
+        grocery_bank.append(grocery)
+        _index_insert(aisle_index, grocery_bank, len(grocery_bank))
+        write = self._db_handler.write_groceries_and_aisle_index(
+            grocery_bank, aisle_index
+        )
         return CurrentGrocery(grocery, write.error)
     
     def get_grocery_bank(self) -> List[Dict[str, Any]]:
         """Return the current grocery bank."""
         read = self._db_handler.read_groceries()
         return read.item_bank
+
+    def get_aisle_order(self) -> AisleOrder:
+        """Return (id, grocery) pairs ordered by aisle, then by name.
+
+        An index that had to be rebuilt is saved for next time; the order is
+        still returned if saving it fails.
+        """
+        read = self._db_handler.read_groceries_and_aisle_index()
+        if read.error:
+            return AisleOrder([], read.error)
+        grocery_bank, aisle_index = read.banks["grocery bank"], read.banks["aisle index"]
+        order = None
+        if _index_fits(aisle_index, grocery_bank, self._layout):
+            order = _index_walk(aisle_index, grocery_bank)
+        if order is None: # No index yet, or the bank or layout moved on without it
+            aisle_index = build_aisle_index(grocery_bank, self._layout)
+            write = self._db_handler.write_aisle_index(aisle_index)
+            return AisleOrder(_index_walk(aisle_index, grocery_bank), write.error)
+        return AisleOrder(order, SUCCESS)
     
     def remove(self, grocery_id: int) -> CurrentGrocery:
         """Remove a grocery item from the database using its id or index."""
-        read = self._db_handler.read_groceries()
+        read = self._db_handler.read_groceries_and_aisle_index()
         if read.error:
             return CurrentGrocery({}, read.error)
+        grocery_bank = read.banks["grocery bank"]
         try:
-            grocery = read.item_bank.pop(grocery_id - 1)
+            id = range(1, len(grocery_bank) + 1)[grocery_id - 1]
         except IndexError:
             return CurrentGrocery({}, ID_ERROR)
-        write = self._db_handler.write_groceries(read.item_bank)
+        aisle_index = self._fit_aisle_index(read.banks["aisle index"], grocery_bank)
+        grocery = grocery_bank.pop(id - 1)
+        for aisle in aisle_index:
+            aisle["IDs"] = [
+                other - (other > id) for other in aisle["IDs"] if other != id
+            ]
+        write = self._db_handler.write_groceries_and_aisle_index(
+            grocery_bank, aisle_index
+        )
         return CurrentGrocery(grocery, write.error)
     
     def remove_all(self) -> CurrentGrocery:
         """Remove all grocery items from the database."""
-        write = self._db_handler.write_groceries([])
-        return CurrentGrocery({}, write.error)
\ No newline at end of file
+        write = self._db_handler.write_groceries_and_aisle_index(
+            [], build_aisle_index([], self._layout)
+        )
+        return CurrentGrocery({}, write.error)
+
+class AsyncGroceryController:
+    """Grocery controller for use inside a running event loop."""
+    def __init__(self, db_path: Path, executor: Optional[Executor] = None) -> None:
+        self._db_handler = AsyncDatabaseHandler(db_path, executor)
+
+    async def add(self, name: List[str], category: GroceryType) -> CurrentGrocery:
+        """Add a new grocery item to the database."""
+        name_text = " ".join(name).lower()
+
+        category_text = category.value
+
+        grocery = {
+            "Name": name_text,
+            "Category": category_text,
+        }
+
+        read = await self._db_handler.read_groceries()
+        if read.error:
+            return CurrentGrocery(grocery, read.error)
+
+        if grocery in read.item_bank:
+            return CurrentGrocery(grocery, EXISTS_ERROR)
+
+        read.item_bank.append(grocery)
+        write = await self._db_handler.write_groceries(read.item_bank)
+        return CurrentGrocery(grocery, write.error)
+
+    async def get_grocery_bank(self) -> List[Dict[str, Any]]:
+        """Return a copy of the current grocery bank."""
+        read = await self._db_handler.read_groceries()
+        return list(read.item_bank)
+
+    async def remove(self, grocery_id: int) -> CurrentGrocery:
+        """Remove a grocery item from the database using its id or index."""
+        read = await self._db_handler.read_groceries()
+        if read.error:
+            return CurrentGrocery({}, read.error)
+        try:
+            grocery = read.item_bank.pop(grocery_id - 1)
+        except IndexError:
+            return CurrentGrocery({}, ID_ERROR)
+        write = await self._db_handler.write_groceries(read.item_bank)
+        return CurrentGrocery(grocery, write.error)
+
+    async def remove_all(self) -> CurrentGrocery:
+        """Remove all grocery items from the database."""
+        write = await self._db_handler.write_groceries([])
+        return CurrentGrocery({}, write.error)
@@ -0,0 +1,229 @@
+"""This module provides the Groceries purchase history functionality."""
+# groceries/history.py
+
+import json
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import date
+from itertools import compress, islice
+from math import fsum
+from operator import le, mul
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from groceries import DB_READ_ERROR, DB_WRITE_ERROR, FORMAT_ERROR, SUCCESS
+from groceries.grocery import GroceryType
+
+# One purchase per row: day (date ordinal), item id, quantity, unit price.
+# Every field is 8 bytes wide, so the file loads straight into two arrays
+# that the columns are sliced out of.
+_ROW = struct.Struct("<qqdd")
+_FIELDS = 4
+
+# bytes.translate tables turning category codes into a 0/1 mask per category.
+# Items with a category outside GroceryType get a code no mask selects.
+_CODES = {category.value: code for code, category in enumerate(GroceryType)}
+_UNKNOWN_CODE = 255
+_MASKS = [
+    bytes(int(code == other) for other in range(256)) for code in range(len(GroceryType))
+]
+
+class Purchase(NamedTuple):
+    name: str
+    category: str
+    unit: str
+    quantity: float
+    price: float
+    day: date
+
+class CurrentPurchase(NamedTuple):
+    purchase: Optional[Purchase]
+    error: int
+
+class HistoryColumns(NamedTuple):
+    day: array
+    item: array
+    quantity: array
+    price: array
+
+class HistoryResponse(NamedTuple):
+    columns: HistoryColumns
+    items: List[Tuple[str, str, str]]
+    error: int
+
+class PriceTrend(NamedTuple):
+    name: str
+    unit: str
+    first_price: float
+    last_price: float
+    purchases: int
+
+class Stats(NamedTuple):
+    category_spend: Dict[str, float]
+    price_trends: List[PriceTrend]
+    projected_cost: float
+    priced: int
+    error: int
+
+def _empty_columns() -> HistoryColumns:
+    return HistoryColumns(array("q"), array("q"), array("d"), array("d"))
+
+class HistoryController:
+    """Record purchases in an append-only store next to the database.
+
+    Purchases go to <db>.history as fixed-width binary rows. Each distinct
+    (name, category, unit) gets an id from <db>.items, a JSON-lines table
+    that is also only ever appended to. Prices of the same item in another
+    unit form a separate series.
+    """
+    def __init__(self, db_path: Path) -> None:
+        self._history_path = db_path.with_name(db_path.name + ".history")
+        self._items_path = db_path.with_name(db_path.name + ".items")
+
+    def _read_items(self) -> Tuple[List[Tuple[str, str, str]], int]:
+        """Return the item table and the size of its complete lines."""
+        if not self._items_path.exists():
+            return [], 0
+        data = self._items_path.read_bytes()
+        end = data.rfind(b"\n") + 1 # Drop a half-written last line
+        items = [tuple(json.loads(line)) for line in data[:end].splitlines() if line.strip()]
+        return items, end
+
+    def add_purchase(
+        self,
+        grocery: Dict[str, Any],
+        quantity: float,
+        unit: str,
+        price: float,
+        day: Optional[date] = None,
+    ) -> CurrentPurchase:
+        """Append one purchase of a grocery item to the history."""
+        purchase = Purchase(
+            grocery["Name"], grocery["Category"], unit.lower(), quantity, price,
+            day or date.today(),
+        )
+        if purchase.category not in _CODES:
+            return CurrentPurchase(purchase, FORMAT_ERROR)
+        key = (purchase.name, purchase.category, purchase.unit)
+        try:
+            items, end = self._read_items()
+        except (OSError, ValueError): # Catch file IO and format problems
+            return CurrentPurchase(purchase, DB_READ_ERROR)
+        try:
+            if key in items:
+                item = items.index(key)
+            else:
+                with self._items_path.open("a") as item_file:
+                    item_file.truncate(end)
+                    item_file.write(json.dumps(key) + "\n")
+                item = len(items)
+            with self._history_path.open("ab") as history:
+                size = history.seek(0, os.SEEK_END)
+                history.truncate(size - size % _ROW.size) # Drop a half-written row
+                history.write(_ROW.pack(purchase.day.toordinal(), item, quantity, price))
+        except OSError: # Catch file IO problems
+            return CurrentPurchase(purchase, DB_WRITE_ERROR)
+        return CurrentPurchase(purchase, SUCCESS)
+
+    def read_columns(self) -> HistoryResponse:
+        """Load the whole history as columns sorted by day.
+
+        Rows whose item is missing from the item table are left out.
+        """
+        try:
+            items, _ = self._read_items()
+            data = self._history_path.read_bytes() if self._history_path.exists() else b""
+        except (OSError, ValueError): # Catch file IO and format problems
+            return HistoryResponse(_empty_columns(), [], DB_READ_ERROR)
+        data = data[:len(data) - len(data) % _ROW.size] # Drop a half-written row
+        ints, floats = array("q"), array("d")
+        ints.frombytes(data)
+        floats.frombytes(data)
+        columns = HistoryColumns(
+            ints[0::_FIELDS], ints[1::_FIELDS], floats[2::_FIELDS], floats[3::_FIELDS]
+        )
+        if columns.item and not 0 <= min(columns.item) <= max(columns.item) < len(items):
+            keep = [0 <= item < len(items) for item in columns.item]
+            columns = HistoryColumns(*(
+                array(column.typecode, compress(column, keep)) for column in columns
+            ))
+        if not all(map(le, columns.day, islice(columns.day, 1, None))): # Back-dated rows
+            order = sorted(range(len(columns.day)), key=columns.day.__getitem__)
+            columns = HistoryColumns(*(
+                array(column.typecode, map(column.__getitem__, order))
+                for column in columns
+            ))
+        return HistoryResponse(columns, items, SUCCESS)
+
+    def get_stats(
+        self,
+        grocery_bank: List[Dict[str, Any]],
+        days: Optional[int] = None,
+        today: Optional[date] = None,
+        trends: int = 10,
+    ) -> Stats:
+        """Summarise spending over the last days and price the grocery bank.
+
+        Every figure is computed a column at a time with map, zip, compress
+        and bytes.translate, so the work per purchase happens in C. Only the
+        per-item and per-category results are handled in Python.
+        """
+        read = self.read_columns()
+        if read.error:
+            return Stats({}, [], 0.0, 0, read.error)
+        columns, items, _ = read
+
+        start = 0
+        if days is not None:
+            first_day = (today or date.today()).toordinal() - days + 1
+            start = bisect_left(columns.day, first_day)
+        item = columns.item[start:]
+        spend = array("d", map(mul, columns.quantity[start:], columns.price[start:]))
+
+        # One category code per purchase, turned into a 0/1 mask per category
+        item_category = bytes(
+            _CODES.get(category, _UNKNOWN_CODE) for _, category, _ in items
+        )
+        category = bytes(map(item_category.__getitem__, item))
+        category_spend = {
+            name: sum(compress(spend, category.translate(_MASKS[code])))
+            for name, code in _CODES.items()
+        }
+
+        # Later rows overwrite earlier ones, so these map each item to the
+        # row of its last purchase overall and its first one in the window
+        last_row = dict(zip(columns.item, range(len(columns.item))))
+        first_row = dict(zip(reversed(item), reversed(range(start, len(columns.item)))))
+        price_trends = [
+            PriceTrend(
+                items[id][0], items[id][2],
+                columns.price[first_row[id]], columns.price[last_row[id]], count,
+            )
+            for id, count in Counter(item).items() if count > 1
+        ]
+        price_trends.sort(
+            key=lambda trend: abs(trend.last_price / trend.first_price - 1)
+            if trend.first_price else 0.0,
+            reverse=True,
+        )
+
+        # The projection uses the whole history, not just the window
+        series: Dict[Tuple[str, str], List[int]] = {}
+        for id, (name, category_name, _) in enumerate(items):
+            series.setdefault((name, category_name), []).append(id)
+        projected, priced = [], 0
+        for grocery in grocery_bank:
+            rows = [
+                last_row[id]
+                for id in series.get((grocery["Name"], grocery["Category"]), [])
+                if id in last_row
+            ]
+            if rows:
+                row = max(rows) # Most recent unit
+                projected.append(columns.price[row] * columns.quantity[row])
+                priced += 1
+        return Stats(
+            category_spend, price_trends[:trends], fsum(projected), priced, SUCCESS
+        )
@@ -0,0 +1,312 @@
+"""This module provides the Groceries database check and repair functionality."""
+# groceries/integrity.py
+
+import codecs
+import json
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from groceries import DB_READ_ERROR, SUCCESS
+from groceries.database import write_database
+from groceries.grocery import GroceryType
+from groceries.transfer import BANK_FIELDS, GROCERY_BANK, RECIPE_BANK
+
+CHUNK_SIZE = 4 * 2**20
+MAX_RECORD_SIZE = 2**20
+
+_CATEGORIES = frozenset(category.value for category in GroceryType)
+_FIELD_SETS = {bank_type: set(fields) for bank_type, fields in BANK_FIELDS.items()}
+_NO_PROBLEMS = {bank_type: {bank_type: None} for bank_type in BANK_FIELDS}
+
+# Tokens that may appear between records: a bank key opening its array, or
+# one of the structural characters. Records themselves are decoded whole.
+_TOKEN = re.compile(
+    r'\s*(?:(?P<key>"(?:[^"\\\n]|\\.)*")\s*:\s*\[|(?P<char>[{\[\]},]))'
+)
+_RESYNC = re.compile(r'[{\[\]},]|"(?:[^"\\\n]|\\.)*"\s*:\s*\[')
+_RECORD_RESYNC = re.compile(r'[{\]]|"(?:[^"\\\n]|\\.)*"\s*:\s*\[')
+_WHITESPACE = re.compile(r"\s*")
+_RECORD_LINE = re.compile(rb"\n[ \t]*\{[ \t]*\r?\n")
+
+class Issue(NamedTuple):
+    offset: Optional[int]
+    message: str
+
+class CheckReport(NamedTuple):
+    counts: Dict[str, int]
+    issues: List[Issue]
+    error: int
+
+def record_problem(record: Any, bank_type: str) -> Optional[str]:
+    """Return why a record does not fit a bank's schema, or None if it does."""
+    fields = BANK_FIELDS[bank_type]
+    if not isinstance(record, dict):
+        return "record is not an object"
+    if record.keys() != _FIELD_SETS[bank_type]:
+        return f"record fields are {sorted(record)}, expected {list(fields)}"
+    if not all(isinstance(record[field], str) for field in fields):
+        return "record fields must be text"
+    if bank_type == GROCERY_BANK and record["Category"] not in _CATEGORIES:
+        return f"unknown category {record['Category']!r}"
+    return None
+
+#
+# Chunk scanning, run in worker processes
+#
+class _Chunk:
+    """Text of one chunk, extended past its end to finish a record."""
+    def __init__(self, db_path: Path, start: int, end: int) -> None:
+        self._db = db_path.open("rb")
+        self._db.seek(start)
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._start = start
+        self.text = self._decoder.decode(self._db.read(end - start))
+        self.limit = len(self.text)
+        self.eof = False
+        self._offset = (0, start)
+
+    def extend(self) -> bool:
+        data = self._db.read(MAX_RECORD_SIZE // 4)
+        self.eof = not data
+        self.text += self._decoder.decode(data, final=self.eof)
+        return not self.eof
+
+    def offset(self, index: int) -> int:
+        """Turn a text index into a byte offset within the file."""
+        last_index, last_offset = self._offset
+        if index < last_index:
+            last_index, last_offset = 0, self._start
+        last_offset += len(self.text[last_index:index].encode())
+        self._offset = (index, last_offset)
+        return last_offset
+
+    def close(self) -> None:
+        self._db.close()
+
+def _scan_chunk(db_path: Path, start: int, end: int) -> Tuple[List[Tuple[Any, ...]], int]:
+    """Tokenize the part of the database between two byte offsets.
+
+    Returns the events found, in file order, and the net change in bracket
+    depth. Each event carries the depth before it relative to the chunk
+    start, since only the caller knows the depth the chunk starts at. Only
+    the first chunk can open the top-level object.
+    """
+    chunk = _Chunk(db_path, start, end)
+    decoder = json.JSONDecoder()
+    events: List[Tuple[Any, ...]] = []
+    depth = 0
+    bank: Optional[str] = None
+    top_open = start != 0
+    pos = 0
+    try:
+        while True:
+            match = _TOKEN.match(chunk.text, pos)
+            token = match.start(match.lastgroup) if match \
+                else _WHITESPACE.match(chunk.text, pos).end()
+            if token >= chunk.limit:
+                break
+            if match is None: # Skip to the next thing that looks like JSON
+                resync = _RESYNC.search(chunk.text, token + 1)
+                pos = resync.start() if resync else len(chunk.text)
+                events.append(("garbage", chunk.offset(token), depth,
+                               chunk.text[token:pos]))
+                continue
+            pos = match.end()
+            char = match.group("char")
+            if match.group("key") is not None:
+                bank = json.loads(match.group("key"))
+                events.append(("key", chunk.offset(token), depth, bank))
+                depth += 1
+            elif char == ",":
+                pass
+            elif char in "[]}":
+                events.append(("char", chunk.offset(token), depth, char))
+                depth += 1 if char == "[" else -1
+            elif not top_open:
+                events.append(("char", chunk.offset(token), depth, char))
+                top_open, depth = True, depth + 1
+            else:
+                try:
+                    record, pos = decoder.raw_decode(chunk.text, token)
+                except json.JSONDecodeError:
+                    if len(chunk.text) - token < MAX_RECORD_SIZE and chunk.extend():
+                        pos = token
+                        continue
+                    # Skip the rest of the broken record, closing brace too
+                    resync = _RECORD_RESYNC.search(chunk.text, token + 1)
+                    pos = resync.start() if resync else len(chunk.text)
+                    events.append(("garbage", chunk.offset(token), depth,
+                                   chunk.text[token:pos]))
+                    continue
+                # Records ahead of the chunk's first key could be in any bank,
+                # so they are checked until one bank accepts them and the
+                # caller checks any other bank it finds they belong to
+                problems = {}
+                for bank_type in (bank,) if bank in BANK_FIELDS else BANK_FIELDS:
+                    problems[bank_type] = record_problem(record, bank_type)
+                    if problems[bank_type] is None: # Shared, so it pickles once
+                        events.append(("record", None, depth, record, _NO_PROBLEMS[bank_type]))
+                        break
+                else:
+                    events.append(("record", chunk.offset(token), depth, record, problems))
+    finally:
+        chunk.close()
+    return events, depth
+
+def _next_record_line(db: IO[bytes], offset: int) -> Optional[int]:
+    """Return the offset of the first line at or after offset holding only "{"."""
+    db.seek(offset)
+    data = b""
+    data_start = offset
+    while True:
+        block = db.read(MAX_RECORD_SIZE)
+        if not block:
+            return None
+        data += block
+        match = _RECORD_LINE.search(data)
+        if match:
+            return data_start + match.start() + 1
+        keep = min(len(data), 64) # Overlap blocks so no match is split
+        data_start += len(data) - keep
+        data = data[-keep:]
+
+def _chunk_bounds(db_path: Path) -> List[Tuple[int, int]]:
+    """Split the file into chunks that each start with a record.
+
+    Chunks start on a line holding only "{", which in the indented layout
+    the database is written in only ever opens a record. A file without
+    such lines stays in one chunk.
+    """
+    size = db_path.stat().st_size
+    bounds = []
+    start = 0
+    with db_path.open("rb") as db:
+        while start < size:
+            end = size
+            if start + CHUNK_SIZE < size:
+                end = _next_record_line(db, start + CHUNK_SIZE - 1) or size
+            bounds.append((start, end))
+            start = end
+    return bounds
+
+def _scan(db_path: Path, workers: Optional[int]) -> Iterator[Tuple[List[Tuple[Any, ...]], int]]:
+    """Scan the chunks of the database in parallel, yielding them in order."""
+    bounds = _chunk_bounds(db_path)
+    workers = min(workers or os.cpu_count() or 1, len(bounds))
+    if workers <= 1:
+        for start, end in bounds:
+            yield _scan_chunk(db_path, start, end)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = []
+        for start, end in bounds: # Keep a bounded number of chunks in flight
+            pending.append(pool.submit(_scan_chunk, db_path, start, end))
+            if len(pending) > workers * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+#
+# Check and repair
+#
+def _walk(
+    db_path: Path, workers: Optional[int], issues: List[Issue]
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (bank type, record) for every record worth keeping.
+
+    Everything else found along the way is added to issues. Records in
+    banks other than the grocery and recipe banks, such as the aisle index,
+    are skipped since they can be rebuilt.
+    """
+    depth = 0
+    bank: Optional[str] = None
+    opened = closed = False
+    seen: Dict[str, set] = {bank_type: set() for bank_type in BANK_FIELDS}
+    for events, chunk_depth in _scan(db_path, workers):
+        base = depth
+        for kind, offset, relative, value, *problems in events:
+            depth = base + relative
+            if closed: # Leftovers of an older, longer file
+                issues.append(Issue(end, "trailing data after the end of the database"))
+                return
+            if kind == "garbage":
+                issues.append(Issue(offset, f"unreadable data {value[:40]!r}"))
+            elif kind == "char" and value == "{" and depth == 0:
+                opened = True
+            elif kind == "key" and depth == 1:
+                bank = value
+            elif kind == "char" and value == "]" and depth == 2:
+                bank = None
+            elif kind == "char" and value == "}" and depth == 1:
+                closed, end = True, offset + 1
+            elif kind == "record" and depth == 2 and bank in BANK_FIELDS:
+                problem = problems[0][bank] if bank in problems[0] \
+                    else record_problem(value, bank)
+                if problem:
+                    issues.append(Issue(offset, f"invalid {bank} record: {problem}"))
+                    continue
+                key = tuple(value[field] for field in BANK_FIELDS[bank])
+                if key in seen[bank]:
+                    issues.append(Issue(offset, f"duplicate {bank} record {value['Name']!r}"))
+                    continue
+                seen[bank].add(key)
+                yield bank, value
+            elif kind == "record" and depth == 2:
+                pass
+            elif kind == "record":
+                issues.append(Issue(offset, "record outside of a bank"))
+            else:
+                issues.append(Issue(offset, f"unexpected {value!r}"))
+        depth = base + chunk_depth
+    if not opened:
+        issues.append(Issue(0, "database does not start with '{'"))
+    elif not closed:
+        issues.append(Issue(db_path.stat().st_size, "database is truncated"))
+
+def check_database(db_path: Path, workers: Optional[int] = None) -> CheckReport:
+    """Validate the database without changing it."""
+    issues: List[Issue] = []
+    counts = {bank_type: 0 for bank_type in BANK_FIELDS}
+    try:
+        for bank_type, _ in _walk(db_path, workers, issues):
+            counts[bank_type] += 1
+    except OSError: # Catch file IO problems
+        return CheckReport(counts, issues, DB_READ_ERROR)
+    return CheckReport(counts, issues, SUCCESS)
+
+def _read_spool(spool: IO[str]) -> Iterator[Dict[str, Any]]:
+    spool.seek(0)
+    for line in spool:
+        yield json.loads(line)
+
+def repair_database(db_path: Path, workers: Optional[int] = None) -> CheckReport:
+    """Rewrite the database with every record that passes the check.
+
+    Salvaged records are spooled to temporary files, so only the keys used
+    to spot duplicates are held in memory. The original file is kept next
+    to it with a .bak suffix. A database without issues is left untouched.
+    """
+    issues: List[Issue] = []
+    counts = {bank_type: 0 for bank_type in BANK_FIELDS}
+    spools = {bank_type: tempfile.TemporaryFile("w+") for bank_type in BANK_FIELDS}
+    try:
+        try:
+            for bank_type, record in _walk(db_path, workers, issues):
+                counts[bank_type] += 1
+                spools[bank_type].write(json.dumps(record) + "\n")
+        except OSError: # Catch file IO problems
+            return CheckReport(counts, issues, DB_READ_ERROR)
+        if not issues:
+            return CheckReport(counts, issues, SUCCESS)
+        error = write_database(
+            db_path,
+            {bank_type: _read_spool(spool) for bank_type, spool in spools.items()},
+            backup_path=db_path.with_name(db_path.name + ".bak"),
+        )
+        return CheckReport(counts, issues, error)
+    finally:
+        for spool in spools.values():
+            spool.close()
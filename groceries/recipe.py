@@ -1,18 +1,32 @@
 """This module provides the Recipes model-controller."""
 # groceries/recipe.py
 
+from concurrent.futures import Executor
 from pathlib import Path
-from typing import Any, Dict, List, NamedTuple
+from typing import Any, ContextManager, Dict, List, NamedTuple, Optional
 from groceries import DB_READ_ERROR, EXISTS_ERROR, ID_ERROR
-from groceries.database import DatabaseHandler
+from groceries.database import AsyncDatabaseHandler, DatabaseHandler, DBBatch
 
 class CurrentRecipe(NamedTuple):
     recipe: Dict[str, Any]
     error: int
 
 class RecipeController:
-    def __init__(self, db_path: Path) -> None:
-        self._db_handler = DatabaseHandler(db_path)
+    def __init__(
+        self,
+        db_path: Path,
+        commit_every: Optional[int] = None,
+        commit_interval: Optional[float] = None,
+    ) -> None:
+        self._db_handler = DatabaseHandler(db_path, commit_every, commit_interval)
+
+    def batch(self) -> ContextManager[DBBatch]:
+        """Apply the changes made inside the block with a single write."""
+        return self._db_handler.batch()
+
+    def flush(self) -> CurrentRecipe:
+        """Write any changes still held back by group commit."""
+        return CurrentRecipe({}, self._db_handler.flush())
 
     def add(self, name: List[str], link: str) -> CurrentRecipe:
         """Add a new recipe to the database."""
@@ -54,4 +68,51 @@ class RecipeController:
     def remove_all(self) -> CurrentRecipe:
         """Remove all recipe itmes from the database."""
         write = self._db_handler.write_recipes([])
-        return CurrentRecipe({}, write.error)
\ No newline at end of file
+        return CurrentRecipe({}, write.error)
+
+class AsyncRecipeController:
+    """Recipe controller for use inside a running event loop."""
+    def __init__(self, db_path: Path, executor: Optional[Executor] = None) -> None:
+        self._db_handler = AsyncDatabaseHandler(db_path, executor)
+
+    async def add(self, name: List[str], link: str) -> CurrentRecipe:
+        """Add a new recipe to the database."""
+        name_text = " ".join(name).lower()
+
+        recipe = {
+            "Name": name_text,
+            "Link": link,
+        }
+
+        read = await self._db_handler.read_recipes()
+        if read.error:
+            return CurrentRecipe(recipe, read.error)
+
+        if recipe in read.item_bank:
+            return CurrentRecipe(recipe, EXISTS_ERROR)
+
+        read.item_bank.append(recipe)
+        write = await self._db_handler.write_recipes(read.item_bank)
+        return CurrentRecipe(recipe, write.error)
+
+    async def get_recipe_bank(self) -> List[Dict[str, Any]]:
+        """Return a copy of the current recipe bank."""
+        read = await self._db_handler.read_recipes()
+        return list(read.item_bank)
+
+    async def remove(self, recipe_id: int) -> CurrentRecipe:
+        """Remove a recipe from the database using its id or index."""
+        read = await self._db_handler.read_recipes()
+        if read.error:
+            return CurrentRecipe({}, read.error)
+        try:
+            recipe = read.item_bank.pop(recipe_id - 1)
+        except IndexError:
+            return CurrentRecipe({}, ID_ERROR)
+        write = await self._db_handler.write_recipes(read.item_bank)
+        return CurrentRecipe(recipe, write.error)
+
+    async def remove_all(self) -> CurrentRecipe:
+        """Remove all recipes from the database."""
+        write = await self._db_handler.write_recipes([])
+        return CurrentRecipe({}, write.error)
@@ -0,0 +1,182 @@
+"""This module provides the Groceries export and import functionality."""
+# groceries/transfer.py
+
+import csv
+import json
+import shutil
+import tempfile
+from enum import Enum
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, TextIO
+from groceries import DB_READ_ERROR, FORMAT_ERROR, JSON_ERROR, SUCCESS
+from groceries.database import DatabaseHandler
+from groceries.grocery import GroceryType
+
+GROCERY_BANK = "grocery bank"
+RECIPE_BANK = "recipe bank"
+
+BANK_FIELDS = {
+    GROCERY_BANK: ("Name", "Category"),
+    RECIPE_BANK: ("Name", "Link"),
+}
+
+VALIDATE_BATCH_SIZE = 1024
+
+_CATEGORIES = frozenset(category.value for category in GroceryType)
+
+class FileFormat(str, Enum):
+    csv   = "csv"
+    jsonl = "jsonl"
+    md    = "md"
+
+class CurrentImport(NamedTuple):
+    count: int
+    error: int
+
+class _InvalidRecord(ValueError):
+    pass
+
+#
+# Readers and writers
+#
+def read_csv(src: TextIO) -> Iterator[Dict[str, Any]]:
+    """Yield one record per CSV row."""
+    yield from csv.DictReader(src)
+
+def read_jsonl(src: TextIO) -> Iterator[Dict[str, Any]]:
+    """Yield one record per non-blank JSON line."""
+    for number, line in enumerate(src, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                raise _InvalidRecord(f"line {number} is not valid JSON") from None
+
+def write_csv(items: Iterable[Dict[str, Any]], out: TextIO, fields: Iterable[str]) -> None:
+    writer = csv.DictWriter(out, fieldnames=list(fields), extrasaction="ignore")
+    writer.writeheader()
+    for item in items:
+        writer.writerow(item)
+
+def write_jsonl(items: Iterable[Dict[str, Any]], out: TextIO) -> None:
+    for item in items:
+        out.write(json.dumps(item) + "\n")
+
+def write_grocery_checklist(items: Iterable[Dict[str, Any]], out: TextIO) -> None:
+    """Write a Markdown checklist with one section per grocery category.
+
+    The bank is read once, with each category spooled to its own temporary
+    file, and the spools are then copied out in category order.
+    """
+    spools = {category.value: tempfile.TemporaryFile("w+") for category in GroceryType}
+    try:
+        for item in items:
+            spool = spools.get(item["Category"])
+            if spool is not None:
+                spool.write(f"- [ ] {item['Name']}\n")
+        out.write("# Groceries\n")
+        for category, spool in spools.items():
+            if spool.tell():
+                out.write(f"\n## {category.capitalize()}\n\n")
+                spool.seek(0)
+                shutil.copyfileobj(spool, out)
+    finally:
+        for spool in spools.values():
+            spool.close()
+
+def write_recipe_checklist(items: Iterable[Dict[str, Any]], out: TextIO) -> None:
+    out.write("# Recipes\n\n")
+    for item in items:
+        out.write(f"- [ ] [{item['Name']}]({item['Link']})\n")
+
+#
+# Validation
+#
+def _batches(records: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    records = iter(records)
+    while batch := list(islice(records, VALIDATE_BATCH_SIZE)):
+        yield batch
+
+def _validate(records: Iterable[Dict[str, Any]], bank_type: str) -> Iterator[Dict[str, Any]]:
+    """Normalise records like the controllers do and check them batch by batch."""
+    fields = BANK_FIELDS[bank_type]
+    for batch in _batches(records):
+        try:
+            batch = [{field: record[field] for field in fields} for record in batch]
+        except (KeyError, TypeError):
+            raise _InvalidRecord(f"records need the fields {', '.join(fields)}")
+        if not all(isinstance(value, str) for record in batch for value in record.values()):
+            raise _InvalidRecord("record fields must be text")
+        for record in batch:
+            for field in fields:
+                record[field] = record[field].strip()
+            record["Name"] = record["Name"].lower()
+        if bank_type == GROCERY_BANK:
+            for record in batch:
+                record["Category"] = record["Category"].lower()
+            unknown = {record["Category"] for record in batch} - _CATEGORIES
+            if unknown:
+                raise _InvalidRecord(f"unknown categories {sorted(unknown)}")
+        yield from batch
+
+def _merge(db_handler: DatabaseHandler, records: Iterable[Dict[str, Any]],
+           bank_type: str, counter: List[int]) -> Iterator[Dict[str, Any]]:
+    """Yield the existing bank followed by the new records it lacks."""
+    fields = BANK_FIELDS[bank_type]
+    seen = set()
+    for item in db_handler.iter_items(bank_type):
+        seen.add(tuple(item.get(field) for field in fields))
+        yield item
+    for record in records:
+        key = tuple(record[field] for field in fields)
+        if key not in seen:
+            seen.add(key)
+            counter[0] += 1
+            yield record
+
+#
+# Pipelines
+#
+def export_bank(db_path: Path, bank_type: str, file_format: FileFormat, out: TextIO) -> int:
+    """Stream a bank out of the database in the given format."""
+    db_handler = DatabaseHandler(db_path)
+    items = db_handler.iter_items(bank_type)
+    try:
+        if file_format == FileFormat.csv:
+            write_csv(items, out, BANK_FIELDS[bank_type])
+        elif file_format == FileFormat.jsonl:
+            write_jsonl(items, out)
+        elif bank_type == GROCERY_BANK:
+            write_grocery_checklist(items, out)
+        else:
+            write_recipe_checklist(items, out)
+    except json.JSONDecodeError: # Catch wrong JSON format
+        return JSON_ERROR
+    except OSError: # Catch file IO problems
+        return DB_READ_ERROR
+    except (AttributeError, KeyError, TypeError): # Catch malformed records
+        return FORMAT_ERROR
+    return SUCCESS
+
+def import_bank(db_path: Path, bank_type: str, file_format: FileFormat, src: TextIO) -> CurrentImport:
+    """Append records read from src to a bank, skipping ones it already has.
+
+    Nothing is written unless every record is valid.
+    """
+    if file_format == FileFormat.csv:
+        records = read_csv(src)
+    elif file_format == FileFormat.jsonl:
+        records = read_jsonl(src)
+    else: # Markdown checklists are for printing only
+        return CurrentImport(0, FORMAT_ERROR)
+    db_handler = DatabaseHandler(db_path)
+    counter = [0]
+    try:
+        error = db_handler.write_stream(
+            _merge(db_handler, _validate(records, bank_type), bank_type, counter),
+            bank_type,
+        )
+    except (_InvalidRecord, csv.Error, UnicodeDecodeError):
+        return CurrentImport(0, FORMAT_ERROR)
+    return CurrentImport(counter[0] if not error else 0, error)
@@ -1,19 +1,28 @@
 # test/test_groceries.py
 
+import asyncio
+import io
+from datetime import date
 import json
+import threading
 import pytest
 from typer.testing import CliRunner
 from groceries import (
     DB_READ_ERROR,
     SUCCESS,
     EXISTS_ERROR,
+    FORMAT_ERROR,
     ID_ERROR,
     JSON_ERROR,
     __app_name__,
     __version__,
     cli,
+    database,
     grocery,
-    recipe
+    history,
+    integrity,
+    recipe,
+    transfer,
 )
 
 runner = CliRunner()
@@ -188,4 +197,518 @@ def test_recipe_remove(mock_json_file, recipe_id, expected):
 
 def test_recipe_remove_all(mock_json_file):
     rc = recipe.RecipeController(mock_json_file)
-    assert rc.remove_all() == ({}, SUCCESS)
\ No newline at end of file
+    assert rc.remove_all() == ({}, SUCCESS)
+
+def test_async_grocery_add(mock_json_file):
+    gc = grocery.AsyncGroceryController(mock_json_file)
+
+    async def _add_twice():
+        return await asyncio.gather(
+            gc.add(test_grocery_data1["name"], test_grocery_data1["category"]),
+            gc.add(test_grocery_data1["name"], test_grocery_data1["category"]),
+        )
+
+    first, second = asyncio.run(_add_twice())
+    assert first == (test_grocery_data1["grocery"], SUCCESS)
+    assert second.error == EXISTS_ERROR
+    read = grocery.GroceryController(mock_json_file)._db_handler.read_groceries()
+    assert len(read.item_bank) == 2
+
+def test_async_grocery_add_wrong_json_file(mock_wrong_json_file):
+    gc = grocery.AsyncGroceryController(mock_wrong_json_file)
+    response = asyncio.run(gc.add(["test item"], grocery.GroceryType.pantry))
+    assert response.error == DB_READ_ERROR
+
+def test_async_recipe_remove(mock_json_file):
+    rc = recipe.AsyncRecipeController(mock_json_file)
+    assert asyncio.run(rc.remove(1)) == (test_recipe1, SUCCESS)
+    assert asyncio.run(rc.remove(1)) == ({}, ID_ERROR)
+
+def test_async_writes_are_coalesced(mock_json_file, monkeypatch):
+    gc = grocery.AsyncGroceryController(mock_json_file)
+    writes = []
+    write_items = gc._db_handler._db_handler.write_items
+    monkeypatch.setattr(
+        gc._db_handler._db_handler,
+        "write_items",
+        lambda item_bank, bank_type: writes.append(len(item_bank))
+            or write_items(item_bank, bank_type),
+    )
+
+    async def _add_many():
+        return await asyncio.gather(*(
+            gc.add([f"item {i}"], grocery.GroceryType.pantry) for i in range(50)
+        ))
+
+    results = asyncio.run(_add_many())
+    assert all(error == SUCCESS for _, error in results)
+    assert writes == [51]
+
+def test_async_load_1000_clients(mock_json_file):
+    """Drive a stand-in HTTP app with 1000 concurrent clients."""
+    clients = 1000
+    gc = grocery.AsyncGroceryController(mock_json_file)
+
+    async def _handle(reader, writer):
+        method, path, _ = (await reader.readline()).decode().split(" ")
+        while (await reader.readline()) not in (b"\r\n", b""):
+            pass
+        if method == "POST":
+            name = path.rsplit("/", 1)[-1]
+            _, error = await gc.add([name], grocery.GroceryType.produce)
+            status = "201 Created" if error == SUCCESS else "409 Conflict"
+            body = b""
+        else:
+            status = "200 OK"
+            body = json.dumps(await gc.get_grocery_bank()).encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+    async def _client(port, i, connections):
+        async with connections:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            if i % 2:
+                request = f"POST /items/item{i} HTTP/1.1\r\n\r\n"
+            else:
+                request = "GET /items HTTP/1.1\r\n\r\n"
+            writer.write(request.encode())
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            await writer.wait_closed()
+        return response.split(b" ", 2)[1]
+
+    async def _load():
+        # Cap open connections so both ends fit in the default ulimit -n 1024
+        connections = asyncio.Semaphore(200)
+        server = await asyncio.start_server(
+            _handle, "127.0.0.1", 0, backlog=clients
+        )
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await asyncio.gather(
+                *(_client(port, i, connections) for i in range(clients))
+            )
+
+    statuses = asyncio.run(_load())
+    assert statuses.count(b"201") == clients // 2
+    assert statuses.count(b"200") == clients // 2
+    read = grocery.GroceryController(mock_json_file)._db_handler.read_groceries()
+    assert len(read.item_bank) == clients // 2 + 1
+
+def test_async_failed_write_drops_snapshot(mock_json_file):
+    gc = grocery.AsyncGroceryController(mock_json_file)
+    text = mock_json_file.read_text()
+
+    async def _add_while_corrupt():
+        await gc.get_grocery_bank()
+        mock_json_file.write_text("")
+        added = await gc.add(["milk"], grocery.GroceryType.dairy)
+        mock_json_file.write_text(text)
+        return added, await gc.get_grocery_bank()
+
+    added, grocery_bank = asyncio.run(_add_while_corrupt())
+    assert added.error == JSON_ERROR
+    assert grocery_bank == [test_grocery1]
+
+def test_async_read_during_write_of_other_bank(mock_json_file, monkeypatch):
+    gc = grocery.AsyncGroceryController(mock_json_file)
+    dumped, release = threading.Event(), threading.Event()
+    dump = json.dump
+
+    def _slow_dump(obj, fp, **kwargs): # Stall the flush with the new data written
+        dump(obj, fp, **kwargs)
+        fp.flush()
+        dumped.set()
+        release.wait(5)
+
+    monkeypatch.setattr(database.json, "dump", _slow_dump)
+
+    async def _read_while_writing():
+        loop = asyncio.get_running_loop()
+        remove = asyncio.ensure_future(gc.remove(1))
+        await loop.run_in_executor(None, dumped.wait, 5)
+        recipes = await gc._db_handler.read_recipes()
+        release.set()
+        return recipes, await remove
+
+    recipes, removed = asyncio.run(_read_while_writing())
+    assert recipes == ([test_recipe1], SUCCESS)
+    assert removed == (test_grocery1, SUCCESS)
+    assert grocery.GroceryController(mock_json_file).get_grocery_bank() == []
+
+def test_grocery_batch(mock_json_file):
+    gc = grocery.GroceryController(mock_json_file)
+    with gc.batch() as batch:
+        assert gc.add(test_grocery_data1["name"], test_grocery_data1["category"]).error == SUCCESS
+        assert gc.add(test_grocery_data2["name"], test_grocery_data2["category"]).error == SUCCESS
+        assert gc.remove(1) == (test_grocery1, SUCCESS)
+        on_disk = grocery.GroceryController(mock_json_file).get_grocery_bank()
+        assert len(on_disk) == 1
+    assert batch.error == SUCCESS
+    assert gc.get_grocery_bank() == [
+        test_grocery_data1["grocery"], test_grocery_data2["grocery"]
+    ]
+    assert json.loads(mock_json_file.read_text())["recipe bank"] == [test_recipe1]
+
+def test_grocery_batch_rollback(mock_json_file):
+    gc = grocery.GroceryController(mock_json_file)
+    with pytest.raises(RuntimeError):
+        with gc.batch():
+            gc.add(test_grocery_data1["name"], test_grocery_data1["category"])
+            raise RuntimeError
+    assert gc.get_grocery_bank() == [test_grocery1]
+
+def test_recipe_group_commit(mock_json_file):
+    rc = recipe.RecipeController(mock_json_file, commit_every=2)
+    assert rc.add(test_recipe_data1["name"], test_recipe_data1["link"]).error == SUCCESS
+    assert len(recipe.RecipeController(mock_json_file).get_recipe_bank()) == 1
+    assert rc.add(test_recipe_data2["name"], test_recipe_data2["link"]).error == SUCCESS
+    assert len(recipe.RecipeController(mock_json_file).get_recipe_bank()) == 3
+    assert rc.remove(1).error == SUCCESS
+    assert len(recipe.RecipeController(mock_json_file).get_recipe_bank()) == 3
+    assert rc.flush() == ({}, SUCCESS)
+    assert len(recipe.RecipeController(mock_json_file).get_recipe_bank()) == 2
+
+def test_grocery_group_commit_interval(mock_json_file, monkeypatch):
+    clock = iter([0.0, 0.0, 30.0, 61.0])
+    monkeypatch.setattr(database.time, "monotonic", lambda: next(clock))
+    gc = grocery.GroceryController(mock_json_file, commit_interval=60)
+    assert gc.add(test_grocery_data1["name"], test_grocery_data1["category"]).error == SUCCESS
+    assert gc.add(test_grocery_data2["name"], test_grocery_data2["category"]).error == SUCCESS
+    assert len(grocery.GroceryController(mock_json_file).get_grocery_bank()) == 1
+    assert gc.add(["apple"], grocery.GroceryType.produce).error == SUCCESS
+    assert len(grocery.GroceryController(mock_json_file).get_grocery_bank()) == 4
+
+def test_grocery_group_commit_failed_flush(mock_json_file):
+    text = mock_json_file.read_text()
+    gc = grocery.GroceryController(mock_json_file, commit_every=2)
+    assert gc.add(test_grocery_data1["name"], test_grocery_data1["category"]).error == SUCCESS
+    mock_json_file.write_text("")
+    assert gc.add(test_grocery_data2["name"], test_grocery_data2["category"]).error == JSON_ERROR
+    mock_json_file.write_text(text)
+    assert gc.flush() == ({}, SUCCESS)
+    assert grocery.GroceryController(mock_json_file).get_grocery_bank() == [
+        test_grocery1, test_grocery_data1["grocery"], test_grocery_data2["grocery"]
+    ]
+
+def test_grocery_batch_failed_flush(mock_json_file):
+    gc = grocery.GroceryController(mock_json_file)
+    with gc.batch() as batch:
+        gc.add(test_grocery_data1["name"], test_grocery_data1["category"])
+        mock_json_file.write_text("")
+    assert batch.error == JSON_ERROR
+    assert gc.get_grocery_bank() == []
+    assert gc.flush() == ({}, SUCCESS)
+
+
+def test_iter_banks_small_chunks(mock_json_file, monkeypatch):
+    monkeypatch.setattr(database._JSONStream.__init__, "__defaults__", (3,))
+    with mock_json_file.open() as db:
+        banks = {bank: list(items) for bank, items in database.iter_banks(db)}
+    assert banks == json.loads(mock_json_file.read_text())
+
+def test_export_csv(mock_json_file):
+    out = io.StringIO()
+    error = transfer.export_bank(
+        mock_json_file, transfer.GROCERY_BANK, transfer.FileFormat.csv, out
+    )
+    assert error == SUCCESS
+    assert out.getvalue().splitlines() == ["Name,Category", "egg,dairy"]
+
+def test_export_grocery_checklist(mock_json_file, monkeypatch):
+    gc = grocery.GroceryController(mock_json_file)
+    gc.add(test_grocery_data1["name"], test_grocery_data1["category"])
+    gc.add(["apple"], grocery.GroceryType.produce)
+    passes = []
+    iter_items = database.DatabaseHandler.iter_items
+    monkeypatch.setattr(
+        database.DatabaseHandler,
+        "iter_items",
+        lambda self, bank_type: passes.append(bank_type) or iter_items(self, bank_type),
+    )
+    out = io.StringIO()
+    transfer.export_bank(
+        mock_json_file, transfer.GROCERY_BANK, transfer.FileFormat.md, out
+    )
+    assert out.getvalue() == (
+        "# Groceries\n\n## Produce\n\n- [ ] apple\n"
+        "\n## Dairy\n\n- [ ] egg\n\n## Pantry\n\n- [ ] chili powder\n"
+    )
+    assert passes == [transfer.GROCERY_BANK]
+
+def test_export_wrong_json_format(mock_wrong_json_format):
+    error = transfer.export_bank(
+        mock_wrong_json_format, transfer.GROCERY_BANK,
+        transfer.FileFormat.jsonl, io.StringIO(),
+    )
+    assert error == JSON_ERROR
+
+def test_cli_export_failure_keeps_target(mock_wrong_json_format, tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, "validate_config", lambda: mock_wrong_json_format)
+    target = tmp_path / "groceries.csv"
+    target.write_text("Name,Category\negg,dairy\n")
+    result = runner.invoke(cli.app, ["export", str(target)])
+    assert result.exit_code == 1
+    assert target.read_text() == "Name,Category\negg,dairy\n"
+    assert not target.with_name("groceries.csv.tmp").exists()
+
+def test_cli_export_malformed_record(tmp_path, monkeypatch):
+    db_file = tmp_path / "groceries.json"
+    db_file.write_text('{"grocery bank": [{"Name": "x"}], "recipe bank": []}')
+    monkeypatch.setattr(cli, "validate_config", lambda: db_file)
+    target = tmp_path / "groceries.md"
+    result = runner.invoke(cli.app, ["export", str(target), "--format", "md"])
+    assert result.exit_code == 1
+    assert "record format error" in result.stdout
+    assert not target.exists()
+    assert not target.with_name("groceries.md.tmp").exists()
+
+def test_import_jsonl(mock_json_file):
+    src = io.StringIO(
+        '{"Name": "Milk", "Category": "DAIRY"}\n'
+        '\n'
+        '{"Name": "egg", "Category": "dairy"}\n'
+    )
+    assert transfer.import_bank(
+        mock_json_file, transfer.GROCERY_BANK, transfer.FileFormat.jsonl, src
+    ) == (1, SUCCESS)
+    gc = grocery.GroceryController(mock_json_file)
+    assert gc.get_grocery_bank() == [test_grocery1, test_grocery_data2["grocery"]]
+    assert recipe.RecipeController(mock_json_file).get_recipe_bank() == [test_recipe1]
+
+def test_import_csv_roundtrip(mock_json_file, tmp_path):
+    out = io.StringIO()
+    transfer.export_bank(
+        mock_json_file, transfer.RECIPE_BANK, transfer.FileFormat.csv, out
+    )
+    db_file = tmp_path / "empty.json"
+    database.init_database(db_file)
+    out.seek(0)
+    assert transfer.import_bank(
+        db_file, transfer.RECIPE_BANK, transfer.FileFormat.csv, out
+    ) == (1, SUCCESS)
+    assert recipe.RecipeController(db_file).get_recipe_bank() == [test_recipe1]
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "Name,Category\nsoap,household\n",
+        "Name\nsoap\n",
+        "Name,Category\nsoap\n",
+    ],
+)
+def test_import_invalid_records(mock_json_file, content):
+    before = mock_json_file.read_text()
+    assert transfer.import_bank(
+        mock_json_file, transfer.GROCERY_BANK, transfer.FileFormat.csv,
+        io.StringIO(content),
+    ) == (0, FORMAT_ERROR)
+    assert mock_json_file.read_text() == before
+
+def test_grocery_aisle_order(mock_json_file):
+    gc = grocery.GroceryController(mock_json_file, layout=["meat", "dairy"])
+    gc.add(["milk"], grocery.GroceryType.dairy)
+    gc.add(["apple"], grocery.GroceryType.produce)
+    gc.add(["bacon"], grocery.GroceryType.meat)
+    gc.add(["cheese"], grocery.GroceryType.dairy)
+    assert [id for id, _ in gc.get_aisle_order().order] == [4, 5, 1, 2, 3]
+    gc.remove(1)
+    assert gc.get_aisle_order().order == [
+        (3, {"Name": "bacon", "Category": "meat"}),
+        (4, {"Name": "cheese", "Category": "dairy"}),
+        (1, {"Name": "milk", "Category": "dairy"}),
+        (2, {"Name": "apple", "Category": "produce"}),
+    ]
+    aisle_index = json.loads(mock_json_file.read_text())["aisle index"]
+    assert aisle_index[:3] == [
+        {"Category": "meat", "IDs": [3]},
+        {"Category": "dairy", "IDs": [4, 1]},
+        {"Category": "produce", "IDs": [2]},
+    ]
+
+def test_grocery_aisle_order_stale_index(mock_json_file):
+    gc = grocery.GroceryController(mock_json_file)
+    gc.add(["milk"], grocery.GroceryType.dairy)
+    db = json.loads(mock_json_file.read_text())
+    db["grocery bank"][0] = {"Name": "apple", "Category": "produce"}
+    mock_json_file.write_text(json.dumps(db))
+    assert [grocery["Name"] for _, grocery in gc.get_aisle_order().order] == [
+        "apple", "milk"
+    ]
+
+def test_grocery_aisle_order_saves_rebuilt_index(mock_json_file, monkeypatch):
+    builds = []
+    build_aisle_index = grocery.build_aisle_index
+    monkeypatch.setattr(
+        grocery,
+        "build_aisle_index",
+        lambda *args: builds.append(args) or build_aisle_index(*args),
+    )
+    gc = grocery.GroceryController(mock_json_file)
+    assert gc.get_aisle_order() == ([(1, test_grocery1)], SUCCESS)
+    assert gc.get_aisle_order() == ([(1, test_grocery1)], SUCCESS)
+    assert len(builds) == 1
+    gc = grocery.GroceryController(mock_json_file, layout=["meat"])
+    gc.get_aisle_order()
+    gc.get_aisle_order()
+    assert len(builds) == 2
+
+def test_grocery_parses_database_once_per_read(mock_json_file, monkeypatch):
+    gc = grocery.GroceryController(mock_json_file)
+    gc.get_aisle_order()
+    loads = []
+    load = json.load
+    monkeypatch.setattr(database.json, "load", lambda db: loads.append(db) or load(db))
+    gc.add(["milk"], grocery.GroceryType.dairy)
+    assert len(loads) == 2 # One read, one read-modify-write
+    gc.get_aisle_order()
+    assert len(loads) == 3
+    gc.remove(1)
+    assert len(loads) == 5
+
+
+def test_check_database_healthy(mock_json_file):
+    report = integrity.check_database(mock_json_file, workers=1)
+    assert report == (
+        {integrity.GROCERY_BANK: 1, integrity.RECIPE_BANK: 1}, [], SUCCESS
+    )
+
+@pytest.fixture
+def mock_damaged_json_file(tmp_path):
+    groceries = [{"Name": f"item {i}", "Category": "pantry"} for i in range(40)]
+    groceries[5]["Category"] = "household"
+    groceries[9] = groceries[8]
+    text = json.dumps(
+        {"grocery bank": groceries, "recipe bank": [test_recipe1]}, indent=4
+    )
+    text = text.replace('"item 20",', '"item 20" oops,')
+    db_file = tmp_path / "groceries.json"
+    db_file.write_text(text + "\n        }\n    ]\n}")
+    return db_file
+
+@pytest.mark.parametrize("chunk_size, workers", [(2**20, 1), (200, 1), (200, 2)])
+def test_check_database_damaged(mock_damaged_json_file, monkeypatch, chunk_size, workers):
+    monkeypatch.setattr(integrity, "CHUNK_SIZE", chunk_size)
+    counts, issues, error = integrity.check_database(mock_damaged_json_file, workers)
+    assert error == SUCCESS
+    assert counts == {integrity.GROCERY_BANK: 37, integrity.RECIPE_BANK: 1}
+    messages = [message for _, message in issues]
+    assert messages[0] == "invalid grocery bank record: unknown category 'household'"
+    assert messages[1] == "duplicate grocery bank record 'item 8'"
+    assert messages[2].startswith("unreadable data")
+    assert messages[3] == "trailing data after the end of the database"
+    assert len(messages) == 4
+
+def test_check_database_truncated(mock_json_file):
+    text = json.dumps(json.loads(mock_json_file.read_text()), indent=4)
+    mock_json_file.write_text(text[:text.index("white chicken chili")])
+    counts, issues, _ = integrity.check_database(mock_json_file, workers=1)
+    assert counts == {integrity.GROCERY_BANK: 1, integrity.RECIPE_BANK: 0}
+    assert issues[-1].message == "database is truncated"
+
+def test_repair_database(mock_damaged_json_file):
+    report = integrity.repair_database(mock_damaged_json_file, workers=1)
+    assert report.error == SUCCESS
+    assert len(report.issues) == 4
+    assert integrity.check_database(mock_damaged_json_file, workers=1).issues == []
+    gc = grocery.GroceryController(mock_damaged_json_file)
+    assert len(gc.get_grocery_bank()) == 37
+    backup = mock_damaged_json_file.with_name("groceries.json.bak")
+    assert backup.read_text().endswith("\n        }\n    ]\n}")
+
+
+def test_history_add_purchase(mock_json_file):
+    hc = history.HistoryController(mock_json_file)
+    purchase, error = hc.add_purchase(test_grocery1, 2, "Dozen", 3.5, date(2026, 3, 1))
+    assert error == SUCCESS
+    assert purchase == ("egg", "dairy", "dozen", 2, 3.5, date(2026, 3, 1))
+    hc.add_purchase(test_grocery1, 1, "dozen", 4.0, date(2026, 2, 1))
+    columns, items, error = hc.read_columns()
+    assert error == SUCCESS
+    assert items == [("egg", "dairy", "dozen")]
+    assert list(columns.day) == [date(2026, 2, 1).toordinal(), date(2026, 3, 1).toordinal()]
+    assert list(columns.price) == [4.0, 3.5]
+
+def test_history_ignores_half_written_row(mock_json_file):
+    hc = history.HistoryController(mock_json_file)
+    hc.add_purchase(test_grocery1, 1, "dozen", 4.0, date(2026, 3, 1))
+    with mock_json_file.with_name("groceries.json.history").open("ab") as rows:
+        rows.write(b"\x01\x02\x03")
+    assert len(hc.read_columns().columns.day) == 1
+    hc.add_purchase(test_grocery1, 2, "dozen", 5.0, date(2026, 3, 2))
+    columns = hc.read_columns().columns
+    assert list(columns.day) == [date(2026, 3, 1).toordinal(), date(2026, 3, 2).toordinal()]
+    assert list(columns.item) == [0, 0]
+    stats = hc.get_stats([test_grocery1], today=date(2026, 3, 31))
+    assert stats.category_spend["dairy"] == 14.0
+    assert stats.projected_cost == 10.0
+
+def test_history_ignores_unknown_item_ids(mock_json_file):
+    hc = history.HistoryController(mock_json_file)
+    hc.add_purchase(test_grocery1, 1, "dozen", 4.0, date(2026, 3, 1))
+    with mock_json_file.with_name("groceries.json.history").open("ab") as rows:
+        rows.write(history._ROW.pack(date(2026, 3, 2).toordinal(), 7, 1, 9.0))
+    stats = hc.get_stats([test_grocery1], today=date(2026, 3, 31))
+    assert stats.error == SUCCESS
+    assert sum(stats.category_spend.values()) == 4.0
+
+def test_history_stats(mock_json_file):
+    gc = grocery.GroceryController(mock_json_file)
+    gc.add(test_grocery_data2["name"], test_grocery_data2["category"])
+    gc.add(["apple"], grocery.GroceryType.produce)
+    milk = test_grocery_data2["grocery"]
+    hc = history.HistoryController(mock_json_file)
+    hc.add_purchase(test_grocery1, 1, "dozen", 3.0, date(2025, 1, 10))
+    hc.add_purchase(milk, 1, "gal", 4.0, date(2026, 1, 10))
+    hc.add_purchase(milk, 2, "gal", 5.0, date(2026, 3, 10))
+    hc.add_purchase(test_grocery1, 1, "dozen", 4.5, date(2026, 3, 11))
+    hc.add_purchase({"Name": "steak", "Category": "meat"}, 2, "lb", 12.0, date(2026, 3, 12))
+    stats = hc.get_stats(gc.get_grocery_bank(), days=365, today=date(2026, 3, 31))
+    assert stats.error == SUCCESS
+    assert stats.category_spend == {
+        "produce": 0.0, "dairy": 18.5, "meat": 24.0,
+        "pantry": 0.0, "frozen": 0.0, "beverage": 0.0,
+    }
+    assert stats.price_trends == [("milk", "gal", 4.0, 5.0, 2)]
+    assert stats.projected_cost == 14.5
+    assert stats.priced == 2
+
+def test_history_unknown_category(mock_json_file):
+    hc = history.HistoryController(mock_json_file)
+    soap = {"Name": "soap", "Category": "household"}
+    assert hc.add_purchase(soap, 1, "bar", 2.0).error == FORMAT_ERROR
+    hc.add_purchase(test_grocery1, 1, "dozen", 3.0, date(2026, 3, 1))
+    with mock_json_file.with_name("groceries.json.items").open("a") as items:
+        items.write(json.dumps(["soap", "household", "bar"]) + "\n")
+    with mock_json_file.with_name("groceries.json.history").open("ab") as rows:
+        rows.write(history._ROW.pack(date(2026, 3, 2).toordinal(), 1, 1, 2.0))
+    stats = hc.get_stats([], today=date(2026, 3, 31))
+    assert stats.error == SUCCESS
+    assert stats.category_spend["dairy"] == 3.0
+    assert sum(stats.category_spend.values()) == 3.0
+
+def test_history_ignores_half_written_item(mock_json_file):
+    hc = history.HistoryController(mock_json_file)
+    hc.add_purchase(test_grocery1, 1, "dozen", 3.0, date(2026, 3, 1))
+    items_file = mock_json_file.with_name("groceries.json.items")
+    with items_file.open("a") as items:
+        items.write('["milk", "da')
+    assert hc.read_columns().items == [("egg", "dairy", "dozen")]
+    milk = test_grocery_data2["grocery"]
+    assert hc.add_purchase(milk, 1, "gal", 4.0, date(2026, 3, 2)).error == SUCCESS
+    assert hc.read_columns().items == [("egg", "dairy", "dozen"), ("milk", "dairy", "gal")]
+    assert items_file.read_text().endswith('\n["milk", "dairy", "gal"]\n')
+
+@pytest.mark.parametrize("args", [["stats"], ["items", "buy", "1", "--price", "2"]])
+def test_cli_history_without_database(monkeypatch, args):
+    calls = []
+    monkeypatch.setattr(cli, "validate_config", lambda: calls.append(None))
+    result = runner.invoke(cli.app, args)
+    assert result.exit_code == 1
+    assert len(calls) == 1